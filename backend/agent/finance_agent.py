@@ -1,11 +1,16 @@
 """LangChain-based financial analysis agent with autonomous tool use."""
 
 from langchain_openai import ChatOpenAI
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage
+from langchain_core.messages import HumanMessage, AIMessage
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain.agents import create_tool_calling_agent, AgentExecutor
 from sqlalchemy.orm import Session
+from database import SessionLocal, Dataset
 from agent.tools import create_tools
+from agent import response_cache
+from functools import lru_cache
+from typing import AsyncIterator
+import httpx
 import os
 
 SYSTEM_PROMPT = """You are an expert financial analyst AI agent. You have access to a set of
@@ -29,25 +34,54 @@ When answering questions:
 
 You are assisting finance professionals, so maintain a professional tone while being thorough."""
 
+_MESSAGE_TYPES = {"user": HumanMessage, "assistant": AIMessage}
 
-def create_finance_agent(db: Session, dataset_id: int) -> AgentExecutor:
-    """Create a LangChain agent with financial analysis tools."""
-    llm = ChatOpenAI(
+# Output of a tool-calling agent stopped by the executor (early_stopping_method="force")
+STOPPED_OUTPUT = "Agent stopped due to max iterations."
+
+# Built once so the request prefix (system prompt + tool schemas + older history)
+# is byte-identical across turns and eligible for OpenAI's automatic prompt caching.
+# Only the newest messages are appended after it; the history window is anchored
+# in fixed blocks (see `_load_chat_history` in main.py), so its oldest messages
+# only drop off once every HISTORY_BLOCK messages.
+PROMPT = ChatPromptTemplate.from_messages([
+    ("system", SYSTEM_PROMPT),
+    MessagesPlaceholder(variable_name="chat_history"),
+    ("human", "{input}"),
+    MessagesPlaceholder(variable_name="agent_scratchpad"),
+])
+
+
+@lru_cache(maxsize=1)
+def get_http_client() -> httpx.AsyncClient:
+    """Return the pooled HTTP/2 client used for OpenAI calls, so connections and TLS sessions are reused."""
+    return httpx.AsyncClient(http2=True, limits=httpx.Limits(max_keepalive_connections=32))
+
+
+async def close_http_client():
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+        get_http_client.cache_clear()
+
+
+@lru_cache(maxsize=1)
+def get_llm() -> ChatOpenAI:
+    """Return the shared chat model. The client is stateless, so one instance serves every agent."""
+    return ChatOpenAI(
         model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
         temperature=0,
         api_key=os.getenv("OPENAI_API_KEY"),
+        http_async_client=get_http_client(),
     )
 
-    tools = create_tools(db, dataset_id)
 
-    prompt = ChatPromptTemplate.from_messages([
-        ("system", SYSTEM_PROMPT),
-        MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{input}"),
-        MessagesPlaceholder(variable_name="agent_scratchpad"),
-    ])
+def create_finance_agent(db: Session, dataset_id: int) -> AgentExecutor:
+    """Create a LangChain agent with financial analysis tools."""
+    llm = get_llm()
 
-    agent = create_tool_calling_agent(llm, tools, prompt)
+    tools = create_tools(db, dataset_id)
+
+    agent = create_tool_calling_agent(llm, tools, PROMPT)
 
     executor = AgentExecutor(
         agent=agent,
@@ -61,29 +95,127 @@ def create_finance_agent(db: Session, dataset_id: int) -> AgentExecutor:
     return executor
 
 
-async def run_agent(db: Session, dataset_id: int, message: str, chat_history: list = None) -> dict:
-    """Run the financial agent with a user message and return the response."""
-    executor = create_finance_agent(db, dataset_id)
+def dataset_signature(db: Session, dataset_id: int) -> tuple:
+    """Return a cheap fingerprint of a dataset that changes whenever it is re-uploaded."""
+    row = (
+        db.query(Dataset.row_count, Dataset.uploaded_at)
+        .filter(Dataset.id == dataset_id)
+        .first()
+    )
+    return tuple(row) if row else ()
+
+
+@lru_cache(maxsize=64)
+def _cached_agent(dataset_id: int, signature: tuple) -> AgentExecutor:
+    """Build an agent once per dataset version instead of once per chat turn.
+
+    Keyed on `dataset_signature`, so a re-uploaded dataset gets a fresh agent.
+    """
+    db = SessionLocal()
+    try:
+        return create_finance_agent(db, dataset_id)
+    finally:
+        db.close()
+
+
+def _hit_iteration_limit(result: dict) -> bool:
+    """True when the executor gave up at max_iterations and returned its stock fallback answer.
+
+    Intermediate steps can't be counted for this: one iteration yields a step
+    per parallel tool call.
+    """
+    return result.get("output") == STOPPED_OUTPUT
+
 
-    history_messages = []
-    if chat_history:
-        for msg in chat_history:
-            if msg["role"] == "user":
-                history_messages.append(HumanMessage(content=msg["message"]))
-            else:
-                history_messages.append(AIMessage(content=msg["message"]))
+def _history_messages(chat_history: list = None) -> list:
+    """Convert stored chat history (already windowed by `_load_chat_history`) to LangChain messages."""
+    return [_MESSAGE_TYPES.get(m["role"], AIMessage)(content=m["message"]) for m in (chat_history or [])]
+
+
+async def run_agent(db: Session, dataset_id: int, message: str, chat_history: list = None) -> dict:
+    """Run the financial agent with a user message and return the response.
+
+    Answers are served from the response cache when the same (or, with
+    SEMANTIC_CACHE enabled, a near-identical) question was already asked
+    about the same dataset version (in the same recent context, for
+    follow-up questions; see `response_cache.cache_scope`). New
+    answers are queued on `db` and written with the chat turn (see
+    `response_cache.write_pending`); answers cut off by the iteration limit
+    are not cached.
+    """
+    signature = dataset_signature(db, dataset_id)
+    scope = response_cache.cache_scope(dataset_id, signature, message, chat_history)
+    key = response_cache.cache_key(scope, message)
+
+    cached, embedding = await response_cache.lookup(db, scope, key, message)
+    if cached is not None:
+        return cached
+
+    executor = _cached_agent(dataset_id, signature)
 
     result = await executor.ainvoke({
         "input": message,
-        "chat_history": history_messages,
+        "chat_history": _history_messages(chat_history),
     })
 
-    tools_used = []
-    for step in result.get("intermediate_steps", []):
-        if hasattr(step[0], "tool"):
-            tools_used.append(step[0].tool)
+    tools_used = dict.fromkeys(
+        step[0].tool for step in result.get("intermediate_steps", []) if hasattr(step[0], "tool")
+    )
 
-    return {
+    response = {
         "response": result["output"],
-        "tools_used": list(set(tools_used)),
+        "tools_used": list(tools_used),
     }
+
+    if not _hit_iteration_limit(result):
+        response_cache.remember(db, scope, key, response, embedding)
+    return response
+
+
+async def stream_agent(db: Session, dataset_id: int, message: str, chat_history: list = None) -> AsyncIterator[dict]:
+    """Run the financial agent and yield events as they happen.
+
+    Yields {"type": "token", "content": ...} for each streamed model delta,
+    {"type": "tool", "name": ...} whenever a tool starts, and finally
+    {"type": "done", "response": ..., "tools_used": [...]} with the full answer.
+    Cached answers are replayed as a single token event.
+    """
+    signature = dataset_signature(db, dataset_id)
+    scope = response_cache.cache_scope(dataset_id, signature, message, chat_history)
+    key = response_cache.cache_key(scope, message)
+
+    cached, embedding = await response_cache.lookup(db, scope, key, message)
+    if cached is not None:
+        yield {"type": "token", "content": cached["response"]}
+        yield {"type": "done", **cached}
+        return
+
+    executor = _cached_agent(dataset_id, signature)
+
+    tokens = []
+    tools_used = {}
+    result = None
+    async for event in executor.astream_events(
+        {"input": message, "chat_history": _history_messages(chat_history)},
+        version="v2",
+    ):
+        kind = event["event"]
+        if kind == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            if content:
+                tokens.append(content)
+                yield {"type": "token", "content": content}
+        elif kind == "on_tool_start":
+            tools_used[event["name"]] = None
+            yield {"type": "tool", "name": event["name"]}
+        elif kind == "on_chain_end" and not event["parent_ids"]:
+            result = event["data"]["output"]
+
+    response = {
+        "response": result["output"] if result is not None else "".join(tokens),
+        "tools_used": list(tools_used),
+    }
+
+    if result is not None and not _hit_iteration_limit(result):
+        response_cache.remember(db, scope, key, response, embedding)
+    yield {"type": "done", **response}
@@ -0,0 +1,175 @@
+"""Response cache for the financial agent.
+
+Answers are keyed on the dataset version and the normalized user message
+(plus the recent conversation for follow-up questions), and stored in SQLite
+so repeat questions skip the agent loop entirely. An optional semantic path
+matches paraphrased questions by embedding similarity within the same scope.
+"""
+
+from langchain_openai import OpenAIEmbeddings
+from sqlalchemy.orm import Session
+from database import AgentResponseCache
+from datetime import datetime, timedelta
+from functools import lru_cache
+import numpy as np
+import hashlib
+import itertools
+import json
+import os
+import re
+
+HISTORY_WINDOW = 4
+SEMANTIC_INDEX_SIZE = 256
+ENTRY_TTL = timedelta(days=7)
+PRUNE_INTERVAL = 100  # cache writes between deletions of expired rows
+
+# Words that make a question lean on earlier turns ("explain that", "what about Q3?")
+FOLLOW_UP_WORDS = frozenset({
+    "it", "its", "that", "this", "these", "those", "they", "them", "their", "there",
+    "above", "previous", "previously", "earlier", "before", "same", "again", "also",
+    "instead", "else", "other", "others", "more", "elaborate", "why", "mentioned", "said",
+})
+FOLLOW_UP_OPENERS = ("and ", "but ", "so ", "what about", "how about")
+
+# Session.info key holding answers waiting to be written by `write_pending`
+PENDING_KEY = "pending_responses"
+
+# scope -> (normalized embedding matrix, cache keys in matching row order)
+_semantic_index: dict[str, tuple[np.ndarray, list[str]]] = {}
+
+_writes = itertools.count(1)
+
+
+def normalize_message(message: str) -> str:
+    return " ".join(message.lower().split())
+
+
+def refers_to_history(message: str) -> bool:
+    """Whether a message reads as a follow-up to earlier turns rather than a self-contained question."""
+    normalized = normalize_message(message)
+    words = set(re.findall(r"[a-z0-9']+", normalized))
+    return not words.isdisjoint(FOLLOW_UP_WORDS) or normalized.startswith(FOLLOW_UP_OPENERS)
+
+
+def cache_scope(dataset_id: int, signature: tuple, message: str, chat_history: list = None) -> str:
+    """Hash everything except the message text that determines the agent's answer.
+
+    Self-contained questions are scoped to the dataset version alone, so a
+    repeat hits however far the conversation has moved on; follow-ups also
+    hash the last HISTORY_WINDOW messages they may refer to.
+    """
+    recent = []
+    if refers_to_history(message):
+        recent = [(m["role"], m["message"]) for m in (chat_history or [])[-HISTORY_WINDOW:]]
+    payload = json.dumps([dataset_id, [str(s) for s in signature], recent])
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def cache_key(scope: str, message: str) -> str:
+    return hashlib.sha256(f"{scope}:{normalize_message(message)}".encode()).hexdigest()
+
+
+def get_cached_response(db: Session, key: str) -> dict | None:
+    entry = (
+        db.query(AgentResponseCache)
+        .filter(AgentResponseCache.key == key, AgentResponseCache.timestamp >= datetime.utcnow() - ENTRY_TTL)
+        .first()
+    )
+    if not entry:
+        return None
+    return {"response": entry.response, "tools_used": json.loads(entry.tools_used)}
+
+
+def store_response(db: Session, key: str, result: dict):
+    """Add or refresh a cache row in the session; the caller commits."""
+    db.merge(AgentResponseCache(
+        key=key,
+        response=result["response"],
+        tools_used=json.dumps(result["tools_used"]),
+        timestamp=datetime.utcnow(),
+    ))
+
+
+def prune_expired(db: Session):
+    """Delete cache rows older than ENTRY_TTL; the caller commits."""
+    cutoff = datetime.utcnow() - ENTRY_TTL
+    db.query(AgentResponseCache).filter(AgentResponseCache.timestamp < cutoff).delete(synchronize_session=False)
+
+
+def write_pending(db: Session):
+    """Write the answers queued by `remember` on this session, dropping expired rows every PRUNE_INTERVAL writes.
+
+    Blocking; meant to run in the same worker-thread transaction that saves
+    the chat turn, which then commits once.
+    """
+    for key, response in db.info.pop(PENDING_KEY, []):
+        store_response(db, key, response)
+        if next(_writes) % PRUNE_INTERVAL == 0:
+            prune_expired(db)
+
+
+async def lookup(db: Session, scope: str, key: str, message: str) -> tuple[dict | None, np.ndarray | None]:
+    """Find a cached answer by exact key, then (if enabled) by semantic similarity.
+
+    Returns the cached response (or None) and the message embedding, if one was
+    computed, so that `remember` can index it without a second embedding call.
+    """
+    cached = get_cached_response(db, key)
+    if cached is not None or not semantic_cache_enabled():
+        return cached, None
+
+    embedding = await embed_message(message)
+    similar_key = find_similar(scope, embedding)
+    if similar_key:
+        cached = get_cached_response(db, similar_key)
+    return cached, embedding
+
+
+def remember(db: Session, scope: str, key: str, response: dict, embedding: np.ndarray | None = None):
+    """Queue an answer for caching on `db` without touching the database.
+
+    The row is written by `write_pending` when the chat turn is saved, so no
+    query or commit runs on the event loop here.
+    """
+    db.info.setdefault(PENDING_KEY, []).append((key, response))
+    if embedding is not None:
+        index_embedding(scope, key, embedding)
+
+
+# ── Semantic matching ──────────────────────────────────────────────
+
+
+def semantic_cache_enabled() -> bool:
+    return os.getenv("SEMANTIC_CACHE", "false").lower() in ("1", "true", "yes")
+
+
+@lru_cache(maxsize=1)
+def get_embeddings() -> OpenAIEmbeddings:
+    return OpenAIEmbeddings(
+        model=os.getenv("OPENAI_EMBEDDING_MODEL", "text-embedding-3-small"),
+        api_key=os.getenv("OPENAI_API_KEY"),
+    )
+
+
+async def embed_message(message: str) -> np.ndarray:
+    vector = np.asarray(await get_embeddings().aembed_query(normalize_message(message)))
+    return vector / np.linalg.norm(vector)
+
+
+def find_similar(scope: str, embedding: np.ndarray) -> str | None:
+    """Return the cache key of the closest earlier question, if it is similar enough."""
+    if scope not in _semantic_index:
+        return None
+
+    matrix, keys = _semantic_index[scope]
+    scores = matrix @ embedding
+    best = int(np.argmax(scores))
+    threshold = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.97"))
+    return keys[best] if scores[best] >= threshold else None
+
+
+def index_embedding(scope: str, key: str, embedding: np.ndarray):
+    matrix, keys = _semantic_index.get(scope, (np.empty((0, embedding.shape[0])), []))
+    matrix = np.vstack([matrix, embedding])[-SEMANTIC_INDEX_SIZE:]
+    keys = (keys + [key])[-SEMANTIC_INDEX_SIZE:]
+    _semantic_index[scope] = (matrix, keys)
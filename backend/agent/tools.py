@@ -1,16 +1,61 @@
 """LangChain tools for the financial analysis agent."""
 
 from langchain_core.tools import tool
+import numpy as np
 from sqlalchemy.orm import Session
 from services.data_pipeline import get_dataset_dataframe
 from services import financial_analysis as fa
 
+RATIO_LABELS = (
+    ("gross_margin", "Gross Margin"),
+    ("operating_margin", "Operating Margin"),
+    ("net_margin", "Net Margin"),
+    ("ebitda_margin", "EBITDA Margin"),
+    ("current_ratio", "Current Ratio"),
+    ("quick_ratio", "Quick Ratio"),
+    ("cash_ratio", "Cash Ratio"),
+    ("debt_to_equity", "Debt to Equity"),
+    ("debt_to_assets", "Debt to Assets"),
+    ("return_on_equity", "Return on Equity (ROE)"),
+    ("return_on_assets", "Return on Assets (ROA)"),
+)
+
+KEYWORDS = ("revenue", "income", "expense", "cost", "profit", "asset",
+            "liability", "equity", "cash", "debt", "ebitda", "tax")
+
+COMPARISON_HEADER = (
+    f"{'Line Item':<30} {'Period 1':>15} {'Period 2':>15} {'Change':>12} {'% Change':>10}",
+    "-" * 85,
+)
+
 
 def create_tools(db: Session, dataset_id: int):
     """Create LangChain tools bound to a specific dataset."""
 
     df = get_dataset_dataframe(db, dataset_id)
 
+    # Everything below is invariant for the dataset, so it is computed once here
+    # and reached from the tool closures instead of being rebuilt on every call.
+    periods = df["period"].unique().tolist()
+    categories = [c for c in df["category"].unique() if c]
+    available_items = df["line_item"].unique().tolist()[:20]
+
+    # Boolean row masks for query_financial_data, keyed by lowercase match text.
+    # Insertion order preserves first-match precedence.
+    period_masks = {}
+    for period in periods:
+        period_masks.setdefault(str(period).lower(), (df["period"] == period).to_numpy())
+
+    category_masks = {}
+    for cat in categories:
+        category_masks.setdefault(cat.lower(), (df["category"] == cat).to_numpy())
+
+    line_items_lower = df["line_item"].str.lower()
+    keyword_masks = {
+        kw: line_items_lower.str.contains(kw, regex=False, na=False).to_numpy()
+        for kw in KEYWORDS
+    }
+
     @tool
     def query_financial_data(query: str) -> str:
         """Query the financial dataset. You can ask for specific line items,
@@ -23,30 +68,18 @@ def create_tools(db: Session, dataset_id: int):
             query: A natural language description of what data to retrieve.
         """
         q = query.lower()
-        result = df.copy()
-
-        # Filter by period
-        for period in df["period"].unique():
-            if str(period).lower() in q:
-                result = result[result["period"] == period]
-                break
-
-        # Filter by category
-        for cat in df["category"].unique():
-            if cat and cat.lower() in q:
-                result = result[result["category"] == cat]
-                break
-
-        # Filter by line item keyword
-        keywords = ["revenue", "income", "expense", "cost", "profit", "asset",
-                     "liability", "equity", "cash", "debt", "ebitda", "tax"]
-        for kw in keywords:
-            if kw in q:
-                result = result[result["line_item"].str.lower().str.contains(kw)]
-                break
+        mask = np.ones(len(df), dtype=bool)
+
+        # Narrow by the first matching period, category and line item keyword
+        for masks in (period_masks, category_masks, keyword_masks):
+            match = next((m for key, m in masks.items() if key in q), None)
+            if match is not None:
+                mask &= match
+
+        result = df[mask]
 
         if result.empty:
-            return f"No matching data found for query: {query}. Available line items: {df['line_item'].unique().tolist()[:20]}"
+            return f"No matching data found for query: {query}. Available line items: {available_items}"
 
         return result.to_string(index=False)
 
@@ -60,21 +93,8 @@ def create_tools(db: Session, dataset_id: int):
         if not ratios:
             return "Could not compute ratios. Check that the dataset contains standard financial line items."
 
-        lines = [f"Financial Ratios (Period: {ratios.pop('period', 'N/A')}):\n"]
-        ratio_labels = {
-            "gross_margin": "Gross Margin",
-            "operating_margin": "Operating Margin",
-            "net_margin": "Net Margin",
-            "ebitda_margin": "EBITDA Margin",
-            "current_ratio": "Current Ratio",
-            "quick_ratio": "Quick Ratio",
-            "cash_ratio": "Cash Ratio",
-            "debt_to_equity": "Debt to Equity",
-            "debt_to_assets": "Debt to Assets",
-            "return_on_equity": "Return on Equity (ROE)",
-            "return_on_assets": "Return on Assets (ROA)",
-        }
-        for key, label in ratio_labels.items():
+        lines = [f"Financial Ratios (Period: {ratios.get('period', 'N/A')}):\n"]
+        for key, label in RATIO_LABELS:
             if key in ratios:
                 unit = "%" if "margin" in key or "return" in key else "x"
                 lines.append(f"  {label}: {ratios[key]}{unit}")
@@ -136,9 +156,7 @@ def create_tools(db: Session, dataset_id: int):
         if "error" in result:
             return result["error"]
 
-        lines = [f"Period Comparison: {result['period_1']} vs {result['period_2']}\n"]
-        lines.append(f"{'Line Item':<30} {'Period 1':>15} {'Period 2':>15} {'Change':>12} {'% Change':>10}")
-        lines.append("-" * 85)
+        lines = [f"Period Comparison: {result['period_1']} vs {result['period_2']}\n", *COMPARISON_HEADER]
 
         for item in result["items"][:20]:
             pct = f"{item['percent_change']:+.1f}%" if item["percent_change"] is not None else "N/A"
@@ -169,7 +187,9 @@ def create_tools(db: Session, dataset_id: int):
 
         return "\n".join(lines)
 
-    return [
+    # Sorted by name so the tool schemas sent to the model are identical for every dataset,
+    # keeping the cacheable prompt prefix stable.
+    tools = [
         query_financial_data,
         calculate_financial_ratios,
         analyze_trends,
@@ -177,3 +197,4 @@ def create_tools(db: Session, dataset_id: int):
         compare_periods,
         get_data_summary,
     ]
+    return sorted(tools, key=lambda t: t.name)
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, Text
+from sqlalchemy import create_engine, event, Column, Integer, String, Float, DateTime, Text
 from sqlalchemy.orm import sessionmaker, declarative_base
 from datetime import datetime
 import os
@@ -6,6 +6,19 @@ import os
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./finance_data.db")
 
 engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+
+
+@event.listens_for(engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    """Use WAL so readers don't block on writes; NORMAL sync is still safe under WAL and fsyncs far less."""
+    if engine.dialect.name != "sqlite":
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -43,6 +56,15 @@ class ChatHistory(Base):
     timestamp = Column(DateTime, default=datetime.utcnow)
 
 
+class AgentResponseCache(Base):
+    __tablename__ = "agent_response_cache"
+
+    key = Column(String, primary_key=True)  # sha256 of dataset version, message and (for follow-ups) recent history
+    response = Column(Text)
+    tools_used = Column(Text)  # JSON string of tool names
+    timestamp = Column(DateTime, default=datetime.utcnow, index=True)
+
+
 def init_db():
     Base.metadata.create_all(bind=engine)
 
@@ -5,16 +5,18 @@ Upload financial data and interact with an autonomous LangChain agent
 that can compute ratios, analyze trends, detect anomalies, and more.
 """
 
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
+from datetime import datetime
+import asyncio
+import hashlib
 import json
 import os
-import shutil
-import tempfile
 
-from database import init_db, get_db, Dataset, ChatHistory
+from database import init_db, get_db, SessionLocal, Dataset, ChatHistory
 from models.schemas import (
     ChatRequest,
     ChatResponse,
@@ -22,7 +24,7 @@ from models.schemas import (
     DatasetResponse,
     UploadResponse,
 )
-from services.data_pipeline import ingest_file, get_dataset_dataframe
+from services.data_pipeline import UPLOAD_DIR, ingest_file, get_dataset_dataframe
 from services.financial_analysis import (
     compute_summary,
     compute_ratios,
@@ -30,10 +32,15 @@ from services.financial_analysis import (
     detect_anomalies,
     compare_periods,
 )
-from agent.finance_agent import run_agent
+from agent.finance_agent import run_agent, stream_agent, close_http_client
+from agent import response_cache
 
 load_dotenv()
 
+# Dataset contents only change on upload, so clients may reuse responses briefly
+# and revalidate with the ETag afterwards.
+CACHE_CONTROL = "private, max-age=300"
+
 app = FastAPI(
     title="AI Finance Agent API",
     description="Upload financial data and chat with an AI agent for analysis.",
@@ -52,7 +59,19 @@ app.add_middleware(
 @app.on_event("startup")
 def startup():
     init_db()
-    os.makedirs("uploads", exist_ok=True)
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+
+    db = SessionLocal()
+    try:
+        response_cache.prune_expired(db)
+        db.commit()
+    finally:
+        db.close()
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    await close_http_client()
 
 
 # ── Dataset endpoints ──────────────────────────────────────────────
@@ -68,14 +87,8 @@ async def upload_file(file: UploadFile = File(...), db: Session = Depends(get_db
     if ext not in ("csv", "xlsx", "xls"):
         raise HTTPException(status_code=400, detail="Only CSV and Excel files are supported")
 
-    with tempfile.NamedTemporaryFile(delete=False, suffix=f".{ext}") as tmp:
-        shutil.copyfileobj(file.file, tmp)
-        tmp_path = tmp.name
-
-    try:
-        dataset_id, df = ingest_file(db, tmp_path, file.filename)
-    finally:
-        os.unlink(tmp_path)
+    # Parse straight from the upload's spooled buffer (in memory for small files)
+    dataset_id, df = ingest_file(db, file.file, file.filename)
 
     preview = df.head(5).to_dict(orient="records")
 
@@ -106,13 +119,29 @@ def list_datasets(db: Session = Depends(get_db)):
     ]
 
 
+def _dataset_etag(dataset: Dataset) -> str:
+    """Validator for responses derived only from a dataset's contents, which change only on upload."""
+    return '"' + hashlib.sha1(f"{dataset.id}:{dataset.uploaded_at}".encode()).hexdigest() + '"'
+
+
+def _etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match", "")
+    return any(tag.strip().removeprefix("W/") in (etag, "*") for tag in if_none_match.split(","))
+
+
 @app.get("/api/datasets/{dataset_id}")
-def get_dataset(dataset_id: int, db: Session = Depends(get_db)):
+def get_dataset(dataset_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
     """Get dataset details and a data preview."""
     dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
+    etag = _dataset_etag(dataset)
+    cache_headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
+
     df = get_dataset_dataframe(db, dataset_id)
     preview = df.head(10).to_dict(orient="records") if not df.empty else []
 
@@ -130,58 +159,126 @@ def get_dataset(dataset_id: int, db: Session = Depends(get_db)):
 # ── Analysis endpoints ─────────────────────────────────────────────
 
 
+def _find_dataset(db: Session, dataset_id: int) -> Dataset | None:
+    return db.query(Dataset).filter(Dataset.id == dataset_id).first()
+
+
 @app.get("/api/datasets/{dataset_id}/analysis", response_model=AnalysisResponse)
-def get_analysis(dataset_id: int, db: Session = Depends(get_db)):
-    """Run a full financial analysis on a dataset."""
-    dataset = db.query(Dataset).filter(Dataset.id == dataset_id).first()
+async def get_analysis(dataset_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    """Run a full financial analysis on a dataset.
+
+    The analyses share one factorized and pivoted context of the frame and
+    are otherwise independent, so they run concurrently in worker threads
+    and the endpoint takes about as long as the slowest one. Clients holding a
+    current copy (If-None-Match) get a 304 without any analysis being run.
+    Database and file reads also run in worker threads, keeping the event
+    loop free.
+    """
+    dataset = await asyncio.to_thread(_find_dataset, db, dataset_id)
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
-    df = get_dataset_dataframe(db, dataset_id)
+    etag = _dataset_etag(dataset)
+    cache_headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if _etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers)
+    response.headers.update(cache_headers)
+
+    df = await asyncio.to_thread(get_dataset_dataframe, db, dataset_id)
     if df.empty:
         raise HTTPException(status_code=400, detail="Dataset has no records")
 
+    async with asyncio.TaskGroup() as tg:
+        summary = tg.create_task(asyncio.to_thread(compute_summary, df))
+        ratios = tg.create_task(asyncio.to_thread(compute_ratios, df))
+        trends = tg.create_task(asyncio.to_thread(compute_trends, df))
+        anomalies = tg.create_task(asyncio.to_thread(detect_anomalies, df))
+        comparison = tg.create_task(asyncio.to_thread(compare_periods, df))
+
     return AnalysisResponse(
         dataset_id=dataset_id,
         dataset_name=dataset.name,
-        summary=compute_summary(df),
-        ratios=compute_ratios(df),
-        trends=compute_trends(df)[:10],
-        anomalies=detect_anomalies(df)[:10],
-        period_comparison=compare_periods(df),
+        summary=summary.result(),
+        ratios=ratios.result(),
+        trends=trends.result()[:10],
+        anomalies=anomalies.result()[:10],
+        period_comparison=comparison.result(),
     )
 
 
 # ── Chat endpoints ─────────────────────────────────────────────────
 
 
-@app.post("/api/chat", response_model=ChatResponse)
+HISTORY_BLOCK = 20
+
+
+def _load_chat_history(db: Session, dataset_id: int) -> list[dict]:
+    """Load a dataset's recent messages, oldest first.
+
+    The window starts at a multiple of HISTORY_BLOCK, so it holds 20-39
+    messages and its oldest message only moves once every HISTORY_BLOCK
+    messages. In between, the history the agent resends is an unchanged
+    prefix that stays eligible for prompt caching (see `PROMPT`).
+    """
+    messages = db.query(ChatHistory).filter(ChatHistory.dataset_id == dataset_id)
+    start = max(messages.count() - HISTORY_BLOCK, 0) // HISTORY_BLOCK * HISTORY_BLOCK
+    history = messages.order_by(ChatHistory.timestamp, ChatHistory.id).offset(start).all()
+    return [{"role": h.role, "message": h.message} for h in history]
+
+
+async def _save_chat_turn(db: Session, dataset_id: int, message: str, asked_at: datetime, response: str):
+    """Save both sides of a turn and any queued response-cache row in one transaction, off the event loop."""
+    def save():
+        response_cache.write_pending(db)
+        db.add_all([
+            ChatHistory(dataset_id=dataset_id, role="user", message=message, timestamp=asked_at),
+            ChatHistory(dataset_id=dataset_id, role="assistant", message=response),
+        ])
+        db.commit()
+
+    await asyncio.to_thread(save)
+
+
+@app.post("/api/chat")
 async def chat(request: ChatRequest, db: Session = Depends(get_db)):
-    """Chat with the AI financial analysis agent."""
+    """Chat with the AI financial analysis agent, streaming the answer as server-sent events.
+
+    Emits `token`, `tool` and a final `done` event (see `stream_agent`).
+    """
     dataset = db.query(Dataset).filter(Dataset.id == request.dataset_id).first()
     if not dataset:
         raise HTTPException(status_code=404, detail="Dataset not found")
 
-    # Load chat history
-    history = (
-        db.query(ChatHistory)
-        .filter(ChatHistory.dataset_id == request.dataset_id)
-        .order_by(ChatHistory.timestamp)
-        .limit(20)
-        .all()
-    )
-    chat_history = [{"role": h.role, "message": h.message} for h in history]
+    chat_history = _load_chat_history(db, request.dataset_id)
+    asked_at = datetime.utcnow()
 
-    # Save user message
-    db.add(ChatHistory(dataset_id=request.dataset_id, role="user", message=request.message))
-    db.commit()
+    async def events():
+        # The request-scoped session may be closed before the body streams,
+        # so the stream uses its own.
+        stream_db = SessionLocal()
+        try:
+            async for event in stream_agent(stream_db, request.dataset_id, request.message, chat_history):
+                if event["type"] == "done":
+                    await _save_chat_turn(stream_db, request.dataset_id, request.message, asked_at, event["response"])
+                yield f"data: {json.dumps(event)}\n\n"
+        finally:
+            stream_db.close()
 
-    # Run agent
-    result = await run_agent(db, request.dataset_id, request.message, chat_history)
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+@app.post("/api/chat/sync", response_model=ChatResponse)
+async def chat_sync(request: ChatRequest, db: Session = Depends(get_db)):
+    """Chat with the AI financial analysis agent and return the full answer at once."""
+    dataset = db.query(Dataset).filter(Dataset.id == request.dataset_id).first()
+    if not dataset:
+        raise HTTPException(status_code=404, detail="Dataset not found")
 
-    # Save assistant response
-    db.add(ChatHistory(dataset_id=request.dataset_id, role="assistant", message=result["response"]))
-    db.commit()
+    chat_history = _load_chat_history(db, request.dataset_id)
+    asked_at = datetime.utcnow()
+
+    result = await run_agent(db, request.dataset_id, request.message, chat_history)
+    await _save_chat_turn(db, request.dataset_id, request.message, asked_at, result["response"])
 
     return ChatResponse(response=result["response"], tools_used=result["tools_used"])
 
@@ -1,15 +1,29 @@
 import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import json
+import os
+from functools import lru_cache
+from typing import BinaryIO
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from database import Dataset, FinancialRecord
 
+UPLOAD_DIR = "uploads"
+RECORD_COLUMNS = ["period", "category", "line_item", "amount"]
 
-def ingest_file(db: Session, file_path: str, filename: str) -> tuple[int, pd.DataFrame]:
-    """Parse an uploaded CSV or Excel file and store it in the database."""
+
+def dataset_path(dataset_id: int) -> str:
+    """Location of a dataset's normalized records, stored as a Parquet file."""
+    return os.path.join(UPLOAD_DIR, f"{dataset_id}.parquet")
+
+
+def ingest_file(db: Session, source: str | BinaryIO, filename: str) -> tuple[int, pd.DataFrame]:
+    """Parse an uploaded CSV or Excel file (a path or binary file object) and store it in the database."""
     if filename.endswith(".xlsx") or filename.endswith(".xls"):
-        df = pd.read_excel(file_path)
+        df = pd.read_excel(source)
     else:
-        df = pd.read_csv(file_path)
+        df = _read_csv(source)
 
     df.columns = df.columns.str.strip()
 
@@ -23,13 +37,47 @@ def ingest_file(db: Session, file_path: str, filename: str) -> tuple[int, pd.Dat
     db.commit()
     db.refresh(dataset)
 
-    _store_records(db, dataset.id, df)
+    _store_records(dataset.id, _normalize_records(df))
 
     return dataset.id, df
 
 
-def _store_records(db: Session, dataset_id: int, df: pd.DataFrame):
-    """Normalize financial data into the records table.
+def _read_csv(source: str | BinaryIO) -> pd.DataFrame:
+    """Parse a CSV with pyarrow's multithreaded reader into NumPy-backed columns.
+
+    Column handling follows pd.read_csv: repeated headers are renamed
+    "name.1", "name.2", ... and all-blank columns (pyarrow's null type) are
+    read as float, so an empty period column stays a period column.
+    """
+    table = pacsv.read_csv(source)
+    table = table.rename_columns(_dedupe_columns(table.column_names))
+    table = table.cast(pa.schema([
+        field.with_type(pa.float64()) if pa.types.is_null(field.type) else field
+        for field in table.schema
+    ]))
+    return table.to_pandas()
+
+
+def _dedupe_columns(names: list[str]) -> list[str]:
+    """Rename repeated column names the way pd.read_csv does ("a", "a.1", "a.2", ...)."""
+    header = set(names)
+    counts = {}
+    result = []
+    for name in names:
+        new_name = name
+        count = counts.get(name, 0)
+        while count > 0:
+            counts[name] = count + 1
+            new_name = f"{name}.{count}"
+            # Skip suffixes that would collide with a header already in the file
+            count = count + 1 if new_name in header else counts.get(new_name, 0)
+        result.append(new_name)
+        counts[new_name] = count + 1
+    return result
+
+
+def _normalize_records(df: pd.DataFrame) -> pd.DataFrame:
+    """Normalize financial data into period/category/line_item/amount records.
 
     Supports two formats:
     1. Wide format: period columns with a line_item/category column
@@ -44,17 +92,12 @@ def _store_records(db: Session, dataset_id: int, df: pd.DataFrame):
         item_col = cols_lower.get("line_item", cols_lower.get("item", cols_lower.get("account")))
 
         if period_col and item_col:
-            for _, row in df.iterrows():
-                record = FinancialRecord(
-                    dataset_id=dataset_id,
-                    period=str(row.get(period_col, "")),
-                    category=str(row.get(category_col, "")) if category_col else "",
-                    line_item=str(row[item_col]),
-                    amount=float(row[cols_lower["amount"]]) if pd.notna(row[cols_lower["amount"]]) else 0.0,
-                )
-                db.add(record)
-            db.commit()
-            return
+            return pd.DataFrame({
+                "period": df[period_col].astype(str),
+                "category": df[category_col].astype(str) if category_col else "",
+                "line_item": df[item_col].astype(str),
+                "amount": df[cols_lower["amount"]].astype(float).fillna(0.0),
+            }).reset_index(drop=True)
 
     # Wide format: first text column is the line item, numeric columns are periods
     text_cols = df.select_dtypes(include=["object"]).columns.tolist()
@@ -64,33 +107,62 @@ def _store_records(db: Session, dataset_id: int, df: pd.DataFrame):
         item_col = text_cols[0]
         category_col = text_cols[1] if len(text_cols) > 1 else None
 
-        for _, row in df.iterrows():
-            for period_col in numeric_cols:
-                record = FinancialRecord(
-                    dataset_id=dataset_id,
-                    period=str(period_col),
-                    category=str(row[category_col]) if category_col else "",
-                    line_item=str(row[item_col]),
-                    amount=float(row[period_col]) if pd.notna(row[period_col]) else 0.0,
-                )
-                db.add(record)
-        db.commit()
+        wide = pd.DataFrame({
+            "line_item": df[item_col].astype(str),
+            "category": df[category_col].astype(str) if category_col else "",
+        })
+        wide[[str(c) for c in numeric_cols]] = df[numeric_cols].astype(float).fillna(0.0).to_numpy()
+
+        # Melt to one row per (line item, period); the stable sort restores row-major order
+        records = (
+            wide.melt(
+                id_vars=["line_item", "category"],
+                var_name="period",
+                value_name="amount",
+                ignore_index=False,
+            )
+            .sort_index(kind="stable")
+        )
+        return records[RECORD_COLUMNS].reset_index(drop=True)
+
+    return pd.DataFrame({
+        "period": pd.Series(dtype=object),
+        "category": pd.Series(dtype=object),
+        "line_item": pd.Series(dtype=object),
+        "amount": pd.Series(dtype=float),
+    })
+
+
+def _store_records(dataset_id: int, records: pd.DataFrame):
+    """Write a dataset's normalized records to its Parquet file."""
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    records.to_parquet(dataset_path(dataset_id), compression="zstd", index=False)
+
+
+@lru_cache(maxsize=32)
+def _read_records(path: str, mtime_ns: int) -> pd.DataFrame:
+    """Read a records file; keyed on mtime so a rewritten file is never served stale."""
+    return pd.read_parquet(path, memory_map=True)
 
 
 def get_dataset_dataframe(db: Session, dataset_id: int) -> pd.DataFrame:
-    """Reconstruct a DataFrame from stored financial records."""
-    records = db.query(FinancialRecord).filter(FinancialRecord.dataset_id == dataset_id).all()
-
-    if not records:
-        return pd.DataFrame()
-
-    data = [
-        {
-            "period": r.period,
-            "category": r.category,
-            "line_item": r.line_item,
-            "amount": r.amount,
-        }
-        for r in records
-    ]
-    return pd.DataFrame(data)
+    """Load a dataset's normalized records as a DataFrame.
+
+    Reads the dataset's Parquet file (memory-mapped), memoized per file
+    version, so the returned frame is shared and must be treated as read-only.
+    Datasets uploaded before Parquet storage only have rows in
+    `financial_records`; those are read straight from the DB-API cursor via
+    the indexed `dataset_id` column.
+    """
+    path = dataset_path(dataset_id)
+    if os.path.exists(path):
+        return _read_records(path, os.stat(path).st_mtime_ns)
+
+    query = select(
+        FinancialRecord.period,
+        FinancialRecord.category,
+        FinancialRecord.line_item,
+        FinancialRecord.amount,
+    ).where(FinancialRecord.dataset_id == dataset_id)
+
+    return pd.read_sql_query(query, db.connection())
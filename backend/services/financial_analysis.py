@@ -1,41 +1,239 @@
+import functools
+import hashlib
+import inspect
+import threading
+import weakref
+from collections import OrderedDict
+from dataclasses import dataclass
+
 import pandas as pd
 import numpy as np
+from pandas.api.typing import DataFrameGroupBy
+
+try:
+    from numba import njit
+except ImportError:  # numba is optional; the NumPy kernels below are used instead
+    njit = None
+
+# String key columns stored as Categoricals for analysis (see _prepare)
+CATEGORICAL_COLUMNS = ("category", "line_item")
+
+# Trend direction labels, indexed by the direction codes of _trend_stats
+DIRECTIONS = np.array(["stable", "increasing", "decreasing"])
+
+# Separators folded to "_" when normalizing line item names
+_ITEM_KEY_TABLE = str.maketrans({" ": "_", "-": "_"})
+
+# Normalized line item names accepted for each metric, in order of preference
+ALIASES: dict[str, tuple[str, ...]] = {
+    "revenue": ("revenue", "total_revenue", "net_revenue", "sales"),
+    "cogs": ("cogs", "cost_of_goods_sold", "cost_of_revenue"),
+    "net_income": ("net_income", "net_profit", "net_earnings"),
+    "operating_income": ("operating_income", "operating_profit", "ebit"),
+    "gross_profit": ("gross_profit",),
+    "ebitda": ("ebitda",),
+    "current_assets": ("current_assets", "total_current_assets"),
+    "current_liabilities": ("current_liabilities", "total_current_liabilities"),
+    "cash": ("cash", "cash_and_equivalents", "cash_and_cash_equivalents"),
+    "inventory": ("inventory", "inventories"),
+    "total_assets": ("total_assets",),
+    "total_liabilities": ("total_liabilities",),
+    "total_equity": ("total_equity", "shareholders_equity", "total_shareholders_equity"),
+}
+
+# Shared context per (frame, row count); an entry is dropped when its frame is collected
+_frames: dict[tuple[int, int], "_FrameState"] = {}
+_frames_lock = threading.Lock()
+
+# Most recent analysis results by (function, content key, arguments), oldest first
+RESULT_CACHE_SIZE = 32
+_results: OrderedDict = OrderedDict()
+_results_lock = threading.Lock()
+
+
+@dataclass
+class AnalysisContext:
+    """Per-dataset values shared by the analysis functions.
+
+    Built once by `build_context` so callers running several analyses on the
+    same frame factorize, sort, pivot and aggregate it a single time.
+    """
+
+    # The records with CATEGORICAL_COLUMNS as Categoricals
+    frame: pd.DataFrame
+    # frame grouped by period; its row partition is computed once and reused
+    by_period: DataFrameGroupBy
+    periods: list
+    # Position of each period in `periods` (and in the columns of `wide`)
+    period_code: dict
+    period_codes: np.ndarray
+    line_items: pd.Index
+    item_codes: np.ndarray
+    amounts: np.ndarray
+    # Row positions ordered by line item, then period
+    row_order: np.ndarray
+    # Per-item row count, mean and population standard deviation of amount
+    item_counts: np.ndarray
+    item_means: np.ndarray
+    item_stds: np.ndarray
+    # Item x period sums, NaN where an item has no rows in a period
+    wide: pd.DataFrame
+    # Category of each item's earliest-period row
+    cat_by_item: dict[str, str]
+
+
+def build_context(df: pd.DataFrame) -> AnalysisContext:
+    """Factorize, sort and pivot a records frame for the analysis functions."""
+    frame = _prepare(df)
+    # Period codes are already positions in sorted period order (see _prepare)
+    period_codes = frame["period"].cat.codes.to_numpy(dtype=np.intp)
+    periods = pd.Index(np.asarray(frame["period"].cat.categories))
+    item_codes, line_items = pd.factorize(frame["line_item"])
+    line_items = pd.Index(np.asarray(line_items))
+    amounts = frame["amount"].to_numpy()
+    n_items, n_periods = len(line_items), len(periods)
+
+    matrix = _pivot_sum(item_codes, period_codes, amounts, n_items, n_periods)
+    cells = np.bincount(item_codes * n_periods + period_codes, minlength=n_items * n_periods)
+    wide = pd.DataFrame(
+        np.where(cells.reshape(n_items, n_periods) > 0, matrix, np.nan),
+        index=line_items,
+        columns=periods,
+    )
+
+    item_counts, item_means, item_stds = _group_stats(item_codes, amounts, n_items)
+
+    row_order = np.lexsort((period_codes, item_codes))
+    item_starts = np.flatnonzero(np.diff(item_codes[row_order])) + 1
+    first_rows = row_order[np.r_[0, item_starts]] if len(row_order) else row_order
+    cat_by_item = dict(zip(line_items, frame["category"].to_numpy()[first_rows]))
+
+    return AnalysisContext(
+        frame=frame,
+        by_period=frame.groupby("period", sort=False, observed=True),
+        periods=periods.tolist(),
+        period_code=dict(zip(periods, range(len(periods)))),
+        period_codes=period_codes,
+        line_items=line_items,
+        item_codes=item_codes,
+        amounts=amounts,
+        row_order=row_order,
+        item_counts=item_counts,
+        item_means=item_means,
+        item_stds=item_stds,
+        wide=wide,
+        cat_by_item=cat_by_item,
+    )
+
+
+@dataclass
+class _FrameState:
+    """The AnalysisContext of one frame object and the content key it was built for."""
+
+    lock: threading.Lock
+    key: tuple[int, str] | None = None
+    ctx: AnalysisContext | None = None
+
+
+def _frame_state(df: pd.DataFrame) -> _FrameState:
+    frame_id = (id(df), len(df))
+    with _frames_lock:
+        state = _frames.get(frame_id)
+        if state is None:
+            state = _frames[frame_id] = _FrameState(threading.Lock())
+            weakref.finalize(df, _frames.pop, frame_id, None)
+    return state
+
+
+def _content_key(df: pd.DataFrame) -> tuple[int, str]:
+    """Key identifying a frame by its contents, row order included; hashed on every call."""
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return len(df), hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+
+
+def _shared_context(df: pd.DataFrame, key: tuple[int, str]) -> AnalysisContext:
+    """The frame's AnalysisContext, built by the first analysis that misses the cache.
+
+    Rebuilt when `key` shows the frame was modified in place since.
+    """
+    state = _frame_state(df)
+    with state.lock:
+        if state.key != key:
+            state.ctx, state.key = build_context(df), key
+    return state.ctx
 
 
-def compute_summary(df: pd.DataFrame) -> dict:
+def _memoized(func):
+    """Cache an analysis function's results by frame contents and arguments.
+
+    The frame is hashed on every call, so one modified in place is analyzed
+    afresh. Serving the same dataset again (another client, a new agent
+    session) skips the analysis, and concurrent analyses of one frame build a
+    single shared context, passed as `ctx` unless the caller supplies one.
+    Results are shared between callers and must be treated as read-only.
+    """
+    signature = inspect.signature(func)
+
+    @functools.wraps(func)
+    def wrapper(df: pd.DataFrame, *args, **kwargs):
+        bound = signature.bind(df, *args, **kwargs)
+        bound.apply_defaults()
+        params = tuple(value for name, value in bound.arguments.items() if name not in ("df", "ctx"))
+        content_key = _content_key(df)
+        key = (func.__name__, content_key, params)
+
+        with _results_lock:
+            result = _results.get(key)
+            if result is not None:
+                _results.move_to_end(key)
+                return result
+
+        if bound.arguments["ctx"] is None:
+            bound.arguments["ctx"] = _shared_context(df, content_key)
+        result = func(*bound.args, **bound.kwargs)
+        with _results_lock:
+            _results[key] = result
+            while len(_results) > RESULT_CACHE_SIZE:
+                _results.popitem(last=False)
+        return result
+
+    return wrapper
+
+
+@_memoized
+def compute_summary(df: pd.DataFrame, *, ctx: AnalysisContext | None = None) -> dict:
     """Compute high-level summary statistics for the financial dataset."""
-    periods = sorted(df["period"].unique().tolist())
-    categories = df["category"].unique().tolist()
-    line_items = df["line_item"].unique().tolist()
-    total_by_period = df.groupby("period")["amount"].sum().to_dict()
+    categories = ctx.frame["category"].unique().tolist()
+    # Ordering the groups only sorts the period codes
+    totals = ctx.by_period["amount"].sum().sort_index()
 
     return {
-        "periods": periods,
+        "periods": totals.index.tolist(),
         "categories": [c for c in categories if c],
-        "line_item_count": len(line_items),
-        "total_by_period": {str(k): round(v, 2) for k, v in total_by_period.items()},
+        "line_item_count": len(ctx.line_items),
+        # Python's round() is correctly rounded at .xx5 ties, which np.round is not
+        "total_by_period": dict(zip(totals.index.astype(str), [round(t, 2) for t in totals.to_numpy().tolist()])),
     }
 
 
-def compute_ratios(df: pd.DataFrame) -> dict:
+@_memoized
+def compute_ratios(df: pd.DataFrame, *, ctx: AnalysisContext | None = None) -> dict:
     """Calculate key financial ratios from the data.
 
     Attempts to identify common financial line items and compute ratios.
     """
     ratios = {}
-    item_map = _build_item_map(df)
 
-    latest_period = sorted(df["period"].unique())[-1]
-    period_data = df[df["period"] == latest_period]
-    pm = _build_item_map(period_data)
+    latest_period = ctx.periods[-1]
+    pm = _build_item_map(ctx.by_period.get_group(latest_period))
 
     # Profitability ratios
-    revenue = pm.get("revenue", pm.get("total_revenue", pm.get("net_revenue", pm.get("sales", 0))))
-    cogs = pm.get("cogs", pm.get("cost_of_goods_sold", pm.get("cost_of_revenue", 0)))
-    net_income = pm.get("net_income", pm.get("net_profit", pm.get("net_earnings", 0)))
-    operating_income = pm.get("operating_income", pm.get("operating_profit", pm.get("ebit", 0)))
-    gross_profit = pm.get("gross_profit", revenue - cogs if revenue and cogs else 0)
-    ebitda = pm.get("ebitda", 0)
+    revenue = _first(pm, "revenue")
+    cogs = _first(pm, "cogs")
+    net_income = _first(pm, "net_income")
+    operating_income = _first(pm, "operating_income")
+    gross_profit = _first(pm, "gross_profit", revenue - cogs if revenue and cogs else 0)
+    ebitda = _first(pm, "ebitda")
 
     if revenue:
         ratios["gross_margin"] = round((gross_profit / revenue) * 100, 2) if gross_profit else None
@@ -44,10 +242,10 @@ def compute_ratios(df: pd.DataFrame) -> dict:
         ratios["ebitda_margin"] = round((ebitda / revenue) * 100, 2) if ebitda else None
 
     # Liquidity ratios
-    current_assets = pm.get("current_assets", pm.get("total_current_assets", 0))
-    current_liabilities = pm.get("current_liabilities", pm.get("total_current_liabilities", 0))
-    cash = pm.get("cash", pm.get("cash_and_equivalents", pm.get("cash_and_cash_equivalents", 0)))
-    inventory = pm.get("inventory", pm.get("inventories", 0))
+    current_assets = _first(pm, "current_assets")
+    current_liabilities = _first(pm, "current_liabilities")
+    cash = _first(pm, "cash")
+    inventory = _first(pm, "inventory")
 
     if current_liabilities:
         ratios["current_ratio"] = round(current_assets / current_liabilities, 2) if current_assets else None
@@ -59,9 +257,9 @@ def compute_ratios(df: pd.DataFrame) -> dict:
         ratios["cash_ratio"] = round(cash / current_liabilities, 2) if cash else None
 
     # Leverage ratios
-    total_assets = pm.get("total_assets", 0)
-    total_liabilities = pm.get("total_liabilities", 0)
-    total_equity = pm.get("total_equity", pm.get("shareholders_equity", pm.get("total_shareholders_equity", 0)))
+    total_assets = _first(pm, "total_assets")
+    total_liabilities = _first(pm, "total_liabilities")
+    total_equity = _first(pm, "total_equity")
 
     if total_equity:
         ratios["debt_to_equity"] = round(total_liabilities / total_equity, 2) if total_liabilities else None
@@ -78,91 +276,108 @@ def compute_ratios(df: pd.DataFrame) -> dict:
     return ratios
 
 
-def compute_trends(df: pd.DataFrame) -> list[dict]:
+@_memoized
+def compute_trends(df: pd.DataFrame, *, ctx: AnalysisContext | None = None) -> list[dict]:
     """Analyze period-over-period trends for each line item."""
-    trends = []
-    periods = sorted(df["period"].unique())
-
+    periods, items = ctx.periods, ctx.line_items
     if len(periods) < 2:
-        return trends
-
-    for item in df["line_item"].unique():
-        item_data = df[df["line_item"] == item].sort_values("period")
-        amounts = item_data.set_index("period")["amount"]
-
-        if len(amounts) < 2:
-            continue
-
-        values = [amounts.get(p, 0) for p in periods]
-        changes = []
-        for i in range(1, len(values)):
-            if values[i - 1] != 0:
-                pct = round(((values[i] - values[i - 1]) / abs(values[i - 1])) * 100, 2)
-            else:
-                pct = None
-            changes.append({"from": periods[i - 1], "to": periods[i], "change_pct": pct})
-
-        avg_change = np.mean([c["change_pct"] for c in changes if c["change_pct"] is not None])
-        direction = "increasing" if avg_change > 2 else "decreasing" if avg_change < -2 else "stable"
-
+        return []
+
+    # Rounded % changes, their mean (skipping transitions from a zero base) and
+    # direction for every item, in one pass over the item x period matrix
+    matrix = np.nan_to_num(ctx.wide.to_numpy(), nan=0.0)
+    pct, avg_change, direction_codes = _trend_stats(matrix)
+    direction = DIRECTIONS[direction_codes]
+    # Python's round() is correctly rounded at .xx5 ties, which np.round is not
+    avg_rounded = np.array([round(a, 2) for a in np.nan_to_num(avg_change, nan=0.0).tolist()])
+
+    # Items seen in at least two rows, largest average change first
+    keep = np.flatnonzero(ctx.item_counts >= 2)
+    keep = keep[np.argsort(-np.abs(avg_rounded[keep]), kind="stable")]
+
+    # Rounded once for the kept rows, converted to Python floats in bulk
+    values = np.round(matrix[keep], 2).tolist()
+    changes = np.where(np.isnan(pct[keep]), None, pct[keep]).tolist()
+    period_labels = [str(p) for p in periods]
+    transitions = list(zip(periods[:-1], periods[1:]))
+
+    rows = zip(
+        items.to_numpy()[keep].tolist(),
+        values,
+        changes,
+        avg_rounded[keep].tolist(),
+        direction[keep].tolist(),
+    )
+    trends = []
+    for item, row_values, row_changes, avg, trend in rows:
         trends.append({
             "line_item": item,
-            "category": item_data.iloc[0]["category"],
-            "values_by_period": {str(p): round(v, 2) for p, v in zip(periods, values)},
-            "period_changes": changes,
-            "avg_change_pct": round(float(avg_change), 2) if not np.isnan(avg_change) else 0,
-            "direction": direction,
+            "category": ctx.cat_by_item[item],
+            "values_by_period": dict(zip(period_labels, row_values)),
+            "period_changes": [
+                {"from": start, "to": end, "change_pct": c}
+                for (start, end), c in zip(transitions, row_changes)
+            ],
+            "avg_change_pct": avg,
+            "direction": trend,
         })
 
-    return sorted(trends, key=lambda t: abs(t["avg_change_pct"]), reverse=True)
+    return trends
 
 
-def detect_anomalies(df: pd.DataFrame) -> list[dict]:
+@_memoized
+def detect_anomalies(df: pd.DataFrame, *, ctx: AnalysisContext | None = None) -> list[dict]:
     """Detect anomalies in the financial data using statistical methods."""
-    anomalies = []
-    periods = sorted(df["period"].unique())
-
-    if len(periods) < 3:
-        return anomalies
-
-    for item in df["line_item"].unique():
-        item_data = df[df["line_item"] == item].sort_values("period")
-        amounts = item_data["amount"].values
-
-        if len(amounts) < 3:
-            continue
-
-        mean = np.mean(amounts)
-        std = np.std(amounts)
-
-        if std == 0:
-            continue
-
-        for _, row in item_data.iterrows():
-            z_score = (row["amount"] - mean) / std
-            if abs(z_score) > 1.5:
-                anomalies.append({
-                    "line_item": row["line_item"],
-                    "category": row["category"],
-                    "period": row["period"],
-                    "amount": round(row["amount"], 2),
-                    "mean": round(mean, 2),
-                    "std_dev": round(std, 2),
-                    "z_score": round(z_score, 2),
-                    "severity": "high" if abs(z_score) > 2.5 else "medium",
-                    "description": (
-                        f"{row['line_item']} in {row['period']} "
-                        f"({'above' if z_score > 0 else 'below'} average by "
-                        f"{abs(round(z_score, 1))} std deviations)"
-                    ),
-                })
-
-    return sorted(anomalies, key=lambda a: abs(a["z_score"]), reverse=True)
-
-
-def compare_periods(df: pd.DataFrame, period1: str | None = None, period2: str | None = None) -> dict:
+    if len(ctx.periods) < 3:
+        return []
+
+    item_codes, amounts = ctx.item_codes, ctx.amounts
+    row_count = ctx.item_counts[item_codes]
+    row_mean = ctx.item_means[item_codes]
+    row_std = ctx.item_stds[item_codes]
+
+    # |z| > 1.5 without the division; pd.eval fuses this into one numexpr pass when available
+    is_anomaly = pd.eval("(row_count >= 3) & (row_std != 0) & (abs(amounts - row_mean) > 1.5 * row_std)")
+
+    # Flagged rows in line item, then period order
+    flagged = ctx.row_order[is_anomaly[ctx.row_order]]
+    z_scores = (amounts[flagged] - row_mean[flagged]) / row_std[flagged]
+    z_rounded = np.round(z_scores, 2)
+
+    # Largest |z| first; the stable sort keeps the order above among ties
+    rank = np.argsort(-np.abs(z_rounded), kind="stable")
+    flagged, z_scores, z_rounded = flagged[rank], z_scores[rank], z_rounded[rank]
+    line_items = df["line_item"].to_numpy()[flagged]
+    periods = df["period"].to_numpy()[flagged]
+    directions = np.where(z_scores > 0, "above", "below")
+
+    anomalies = pd.DataFrame({
+        "line_item": line_items,
+        "category": df["category"].to_numpy()[flagged],
+        "period": periods,
+        "amount": [round(a, 2) for a in amounts[flagged].tolist()],
+        "mean": np.round(row_mean[flagged], 2),
+        "std_dev": np.round(row_std[flagged], 2),
+        "z_score": z_rounded,
+        "severity": np.where(np.abs(z_scores) > 2.5, "high", "medium"),
+        "description": [
+            f"{item} in {period} ({direction} average by {abs(round(z, 1))} std deviations)"
+            for item, period, direction, z in zip(line_items, periods, directions, z_scores.tolist())
+        ],
+    })
+    return anomalies.to_dict(orient="records")
+
+
+@_memoized
+def compare_periods(
+    df: pd.DataFrame,
+    period1: str | None = None,
+    period2: str | None = None,
+    *,
+    ctx: AnalysisContext | None = None,
+) -> dict:
     """Compare two periods side by side."""
-    periods = sorted(df["period"].unique())
+    periods = ctx.periods
 
     if len(periods) < 2:
         return {"error": "Need at least 2 periods for comparison"}
@@ -170,37 +385,159 @@ def compare_periods(df: pd.DataFrame, period1: str | None = None, period2: str |
     p1 = period1 or periods[-2]
     p2 = period2 or periods[-1]
 
-    df1 = df[df["period"] == p1].set_index("line_item")["amount"]
-    df2 = df[df["period"] == p2].set_index("line_item")["amount"]
-
-    all_items = sorted(set(df1.index) | set(df2.index))
-    comparison = []
-
-    for item in all_items:
-        v1 = df1.get(item, 0)
-        v2 = df2.get(item, 0)
-        change = v2 - v1
-        change_pct = round((change / abs(v1)) * 100, 2) if v1 != 0 else None
-
-        comparison.append({
-            "line_item": item,
-            "period_1_value": round(v1, 2),
-            "period_2_value": round(v2, 2),
-            "absolute_change": round(change, 2),
-            "percent_change": change_pct,
-        })
+    # Both periods' columns of the pivot; a period not in the data has no values
+    wide = ctx.wide.to_numpy()
+    absent = np.full(len(wide), np.nan)
+    v1, v2 = (wide[:, ctx.period_code[p]] if p in ctx.period_code else absent for p in (p1, p2))
+
+    # Items present in either period, sorted by name, missing values as 0
+    present = np.flatnonzero(~(np.isnan(v1) & np.isnan(v2)))
+    names = ctx.line_items.to_numpy()[present]
+    by_name = np.argsort(names, kind="stable")
+    names, rows = names[by_name], present[by_name]
+    v1, v2 = np.nan_to_num(v1[rows]), np.nan_to_num(v2[rows])
+    change = v2 - v1
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.where(v1 != 0, (change / np.abs(v1)) * 100, np.nan)
+
+    comparison = pd.DataFrame({
+        "line_item": names,
+        "period_1_value": np.round(v1, 2),
+        "period_2_value": np.round(v2, 2),
+        "absolute_change": np.round(change, 2),
+        "percent_change": np.where(np.isnan(pct), None, np.round(pct, 2)),
+    })
+    order = np.argsort(-np.abs(comparison["absolute_change"].to_numpy()), kind="stable")
 
     return {
         "period_1": p1,
         "period_2": p2,
-        "items": sorted(comparison, key=lambda x: abs(x["absolute_change"]), reverse=True),
+        "items": comparison.iloc[order].to_dict(orient="records"),
     }
 
 
 def _build_item_map(df: pd.DataFrame) -> dict:
-    """Build a mapping of normalized line item names to their amounts."""
-    item_map = {}
-    for _, row in df.iterrows():
-        key = row["line_item"].lower().strip().replace(" ", "_").replace("-", "_")
-        item_map[key] = row["amount"]
-    return item_map
+    """Build a mapping of normalized line item names to their amounts.
+
+    Duplicate names keep the last amount, as dict construction does.
+    """
+    items = df["line_item"]
+    # Names repeat across rows, so each distinct name is normalized once
+    normalized = {name: str(name).lower().strip().translate(_ITEM_KEY_TABLE) for name in items.unique()}
+    return dict(zip(items.map(normalized).to_numpy(), df["amount"].to_numpy()))
+
+
+def _first(pm: dict, metric: str, default=0):
+    """Amount of the first alias of `metric` present in the item map."""
+    return next((pm[name] for name in ALIASES[metric] if name in pm), default)
+
+
+def _prepare(df: pd.DataFrame) -> pd.DataFrame:
+    """Copy of `df` laid out for analysis; the input frame is left as is.
+
+    `period` becomes an ordered Categorical over the sorted periods, so its
+    codes are sort positions and the periods are sorted exactly once here.
+    CATEGORICAL_COLUMNS become Categoricals too, so groupbys, equality masks
+    and unique() work on the integer codes instead of hashing and comparing
+    strings. `amount` becomes one contiguous float64 buffer, so reductions
+    and the numeric kernels read it with unit stride.
+    """
+    columns = {
+        col: df[col].astype("category")
+        for col in CATEGORICAL_COLUMNS
+        if not isinstance(df[col].dtype, pd.CategoricalDtype)
+    }
+    columns["period"] = pd.Categorical(np.asarray(df["period"]), ordered=True)
+    columns["amount"] = np.ascontiguousarray(df["amount"].to_numpy(dtype=np.float64))
+    return df.assign(**columns)
+
+
+# ── Numeric kernels ────────────────────────────────────────────────
+#
+# Each kernel has a loop version that numba compiles when it is installed
+# and an equivalent vectorized NumPy version used otherwise. Inputs are plain
+# float64 amounts and int64 group codes (from pd.factorize).
+
+
+def _group_stats_loop(codes, amounts, n_groups):
+    counts = np.zeros(n_groups, dtype=np.int64)
+    sums = np.zeros(n_groups)
+    for i in range(codes.shape[0]):
+        counts[codes[i]] += 1
+        sums[codes[i]] += amounts[i]
+
+    means = sums / counts
+    sq_dev = np.zeros(n_groups)
+    for i in range(codes.shape[0]):
+        d = amounts[i] - means[codes[i]]
+        sq_dev[codes[i]] += d * d
+
+    return counts, means, np.sqrt(sq_dev / counts)
+
+
+def _group_stats_numpy(codes, amounts, n_groups):
+    counts = np.bincount(codes, minlength=n_groups)
+    means = np.bincount(codes, weights=amounts, minlength=n_groups) / counts
+    sq_dev = np.bincount(codes, weights=(amounts - means[codes]) ** 2, minlength=n_groups)
+    return counts, means, np.sqrt(sq_dev / counts)
+
+
+def _pivot_sum_loop(item_codes, period_codes, amounts, n_items, n_periods):
+    matrix = np.zeros((n_items, n_periods))
+    for i in range(item_codes.shape[0]):
+        matrix[item_codes[i], period_codes[i]] += amounts[i]
+    return matrix
+
+
+def _pivot_sum_numpy(item_codes, period_codes, amounts, n_items, n_periods):
+    flat = np.bincount(item_codes * n_periods + period_codes, weights=amounts, minlength=n_items * n_periods)
+    return flat.reshape(n_items, n_periods)
+
+
+def _trend_stats_loop(values):
+    # Fused per-item pass: rounded % changes (NaN from a zero base), their mean
+    # (NaN when there are none) and the direction code of that mean
+    n_items, n_periods = values.shape
+    pct = np.full((n_items, max(n_periods - 1, 0)), np.nan)
+    avg = np.full(n_items, np.nan)
+    direction = np.zeros(n_items, dtype=np.int8)
+    for i in range(n_items):
+        total = 0.0
+        n_valid = 0
+        for j in range(1, n_periods):
+            prev = values[i, j - 1]
+            if prev != 0:
+                change = np.rint(((values[i, j] - prev) / abs(prev)) * 100 * 100) / 100
+                pct[i, j - 1] = change
+                total += change
+                n_valid += 1
+        if n_valid > 0:
+            avg[i] = total / n_valid
+            if avg[i] > 2:
+                direction[i] = 1
+            elif avg[i] < -2:
+                direction[i] = 2
+    return pct, avg, direction
+
+
+def _trend_stats_numpy(values):
+    prev = values[:, :-1]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = np.round(np.where(prev != 0, ((values[:, 1:] - prev) / np.abs(prev)) * 100, np.nan), 2)
+
+    # nanmean only over rows with a valid change; all-NaN rows stay NaN without a warning
+    avg = np.full(len(pct), np.nan)
+    has_change = ~np.isnan(pct).all(axis=1)
+    avg[has_change] = np.nanmean(pct[has_change], axis=1)
+    direction = np.select([avg > 2, avg < -2], [1, 2], 0).astype(np.int8)
+    return pct, avg, direction
+
+
+if njit is not None:
+    _group_stats = njit(cache=True)(_group_stats_loop)
+    _pivot_sum = njit(cache=True)(_pivot_sum_loop)
+    _trend_stats = njit(cache=True)(_trend_stats_loop)
+else:
+    _group_stats = _group_stats_numpy
+    _pivot_sum = _pivot_sum_numpy
+    _trend_stats = _trend_stats_numpy
@@ -0,0 +1,44 @@
+"""The numba kernels and their NumPy fallbacks must agree on the same inputs."""
+import numpy as np
+import pytest
+
+from services import financial_analysis as fa
+
+
+@pytest.fixture
+def rng():
+    return np.random.default_rng(0)
+
+
+def test_group_stats_loop_matches_numpy(rng):
+    codes = rng.integers(0, 12, 500)
+    amounts = rng.normal(1000, 250, 500)
+
+    for expected, actual in zip(fa._group_stats_numpy(codes, amounts, 12), fa._group_stats_loop(codes, amounts, 12)):
+        np.testing.assert_allclose(actual, expected)
+
+
+def test_pivot_sum_loop_matches_numpy(rng):
+    item_codes = rng.integers(0, 30, 500)
+    period_codes = rng.integers(0, 6, 500)
+    amounts = rng.normal(0, 1e6, 500)
+
+    np.testing.assert_allclose(
+        fa._pivot_sum_loop(item_codes, period_codes, amounts, 30, 6),
+        fa._pivot_sum_numpy(item_codes, period_codes, amounts, 30, 6),
+    )
+
+
+def test_trend_stats_loop_matches_numpy(rng):
+    # Zeros give NaN changes, including rows with no valid change at all
+    values = rng.normal(0, 1000, (40, 6)).round(2)
+    values[rng.random(values.shape) < 0.2] = 0.0
+    values[0] = 0.0
+
+    expected = fa._trend_stats_numpy(values)
+    for kernel in (fa._trend_stats_loop, fa._trend_stats):
+        pct, avg, direction = kernel(values)
+        np.testing.assert_array_equal(pct, expected[0])
+        np.testing.assert_allclose(avg, expected[1], equal_nan=True)
+        np.testing.assert_array_equal(direction, expected[2])
+
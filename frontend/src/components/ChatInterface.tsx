@@ -2,7 +2,7 @@
 
 import { useState, useRef, useEffect } from "react";
 import { Send, Bot, User, Wrench, Loader2 } from "lucide-react";
-import { sendChatMessage } from "@/lib/api";
+import { streamChatMessage } from "@/lib/api";
 import type { ChatMessage } from "@/types";
 
 interface ChatInterfaceProps {
@@ -40,22 +40,41 @@ export default function ChatInterface({
     setInput("");
     setLoading(true);
 
+    // Render the assistant reply as it streams in
+    const updateReply = (reply: ChatMessage) =>
+      setMessages((prev) => [...prev.slice(0, -1), reply]);
+    let reply: ChatMessage = { role: "assistant", message: "", tools_used: [] };
+    let started = false;
+
     try {
-      const data = await sendChatMessage(datasetId, text);
-      const assistantMsg: ChatMessage = {
+      await streamChatMessage(datasetId, text, (event) => {
+        if (event.type === "token") {
+          reply = { ...reply, message: reply.message + event.content };
+        } else if (event.type === "tool") {
+          reply = { ...reply, tools_used: [...(reply.tools_used ?? []), event.name] };
+          return;
+        } else {
+          reply = { ...reply, message: event.response, tools_used: event.tools_used };
+        }
+
+        if (started) {
+          updateReply(reply);
+        } else {
+          started = true;
+          setLoading(false);
+          setMessages((prev) => [...prev, reply]);
+        }
+      });
+    } catch {
+      const errorMsg: ChatMessage = {
         role: "assistant",
-        message: data.response,
-        tools_used: data.tools_used,
+        message: "Sorry, I encountered an error. Please check that the backend is running and your OpenAI API key is configured.",
       };
-      setMessages((prev) => [...prev, assistantMsg]);
-    } catch {
-      setMessages((prev) => [
-        ...prev,
-        {
-          role: "assistant",
-          message: "Sorry, I encountered an error. Please check that the backend is running and your OpenAI API key is configured.",
-        },
-      ]);
+      if (started) {
+        updateReply(errorMsg);
+      } else {
+        setMessages((prev) => [...prev, errorMsg]);
+      }
     } finally {
       setLoading(false);
     }
@@ -1,3 +1,5 @@
+import type { ChatStreamEvent } from "@/types";
+
 const API_BASE = process.env.NEXT_PUBLIC_API_URL || "http://localhost:8000";
 
 async function fetchApi<T>(
@@ -47,10 +49,52 @@ export async function getAnalysis(datasetId: number) {
 }
 
 export async function sendChatMessage(datasetId: number, message: string) {
-  return fetchApi<{ response: string; tools_used: string[] }>("/api/chat", {
+  return fetchApi<{ response: string; tools_used: string[] }>("/api/chat/sync", {
+    method: "POST",
+    body: JSON.stringify({ dataset_id: datasetId, message }),
+  });
+}
+
+export async function streamChatMessage(
+  datasetId: number,
+  message: string,
+  onEvent: (event: ChatStreamEvent) => void
+) {
+  const res = await fetch(`${API_BASE}/api/chat`, {
     method: "POST",
+    headers: { "Content-Type": "application/json" },
     body: JSON.stringify({ dataset_id: datasetId, message }),
   });
+
+  if (!res.ok || !res.body) {
+    const error = await res.json().catch(() => ({ detail: res.statusText }));
+    throw new Error(error.detail || "Request failed");
+  }
+
+  const reader = res.body.getReader();
+  const decoder = new TextDecoder();
+  let buffer = "";
+  let done = false;
+
+  while (true) {
+    const { value, done: streamDone } = await reader.read();
+    if (streamDone) break;
+    buffer += decoder.decode(value, { stream: true });
+
+    // Server-sent events are separated by a blank line
+    const events = buffer.split("\n\n");
+    buffer = events.pop() ?? "";
+    for (const raw of events) {
+      if (!raw.startsWith("data: ")) continue;
+      const event = JSON.parse(raw.slice(6)) as ChatStreamEvent;
+      if (event.type === "done") done = true;
+      onEvent(event);
+    }
+  }
+
+  if (!done) {
+    throw new Error("Chat stream ended unexpectedly");
+  }
 }
 
 export async function getChatHistory(datasetId: number) {
@@ -70,3 +70,8 @@ export interface ChatMessage {
   timestamp?: string;
   tools_used?: string[];
 }
+
+export type ChatStreamEvent =
+  | { type: "token"; content: string }
+  | { type: "tool"; name: string }
+  | { type: "done"; response: string; tools_used: string[] };